@@ -1,67 +1,275 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+# Optional native build (keep the module mypyc-compatible; re-run after changing it):
+#   cd scripts && python -m mypyc --ignore-missing-imports convert_to_jsonl.py
+# --ignore-missing-imports is needed because ijson ships without type information and
+# orjson/simdjson/ijson may not be installed at all. The compiled convert_to_jsonl.*.so is
+# written to the current directory; use it with
+#   python -c "import convert_to_jsonl; convert_to_jsonl.main()" [options]
+
 import argparse
-import io
 import json
+import multiprocessing
 import os
+import re
 import sys
-from typing import Any, Dict, List, Optional
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib parser/serializer
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import ijson
+except ImportError:
+    ijson = None  # type: ignore[assignment]
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None  # type: ignore[assignment]
 
 
 Role = str
 Message = Dict[str, str]
 Record = Dict[str, Any]
+Converter = Callable[[Record], Optional[Record]]
+
+# Output is accumulated and written in chunks of roughly this many bytes
+WRITE_BUFFER_SIZE = 1 << 20
+# Number of raw input lines handed to a worker process at a time with --workers > 1
+PARALLEL_BATCH_LINES = 1000
+
+
+if orjson is not None:
+    loads = orjson.loads
+else:
+    loads = json.loads
+
+
+def json_dumps_line(obj: Any) -> bytes:
+    # Stdlib fallback for orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE), which the write
+    # loops call inline: compact UTF-8 output followed by the JSONL newline
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class PrefixedStream:
+    """Binary reader that replays already-consumed ``prefix`` bytes before the rest of ``stream``."""
+
+    def __init__(self, prefix: bytes, stream: Union[BinaryIO, "PrefixedStream"]) -> None:
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._prefix:
+            return self._stream.read(size)
+        if size is None or size < 0:
+            data, self._prefix = self._prefix + self._stream.read(), b""
+        else:
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+        return data
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self._prefix:
+            prefix, self._prefix = self._prefix, b""
+            if not prefix.endswith(b"\n"):
+                # Complete the partially consumed first line
+                prefix += next(iter(self._stream), b"")
+            yield prefix
+        yield from self._stream
+
 
+def sniff_json_array(stream: BinaryIO) -> Tuple[bytes, bool]:
+    # Consume leading whitespace plus the first significant byte, so format detection never
+    # buffers a whole line (json.dump writes an entire array on a single line).
+    consumed = bytearray()
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            return bytes(consumed), False
+        consumed += byte
+        if not byte.isspace():
+            return bytes(consumed), byte == b"["
 
-def normalize_role(value: str) -> Optional[Role]:
-    v = (value or "").strip().lower()
-    if v in {"system", "user", "assistant"}:
-        return v
-    if v in {"human"}:
-        return "user"
-    return None
+
+def iter_json_array_items(stream: PrefixedStream, stream_array: bool) -> Iterator[Any]:
+    if stream_array:
+        return iter_json_array_stream(stream)
+    # Read the whole file content in one bulk read
+    return iter_json_array(stream.read())
+
+
+def iter_json_array_stream(stream: PrefixedStream) -> Iterator[Any]:
+    # Incremental parse: yields each top-level item without holding the whole array in memory.
+    # ijson picks its fastest available backend (yajl2_c) by default, which rejects some valid
+    # JSON (integers outside int64, overflowing floats, NaN/Infinity), so this path is opt-in
+    # via --stream-array.
+    try:
+        for item in ijson.items(stream, "item", use_float=True):
+            yield item
+    except ijson.JSONError as e:
+        raise SystemExit(f"Failed to stream JSON array input: {e}")
+
+
+# Reused across documents so simdjson keeps its internal buffers allocated
+_simdjson_parser = simdjson.Parser() if simdjson is not None else None
+
+
+def iter_json_array(data: bytes) -> Iterator[Any]:
+    if _simdjson_parser is not None:
+        try:
+            doc = _simdjson_parser.parse(data)
+        except (ValueError, RuntimeError):
+            # simdjson is strict RFC 8259 (no NaN/Infinity, no big ints); let the stdlib decide below
+            doc = None
+        if doc is not None:
+            if not isinstance(doc, simdjson.Array):
+                raise SystemExit("Top-level JSON must be a list when using array format.")
+            # Materialize one record at a time; downstream code relies on real dict/list types
+            for value in doc:
+                if isinstance(value, simdjson.Object):
+                    yield value.as_dict()
+                elif isinstance(value, simdjson.Array):
+                    yield value.as_list()
+                else:
+                    yield value
+            return
+
+    try:
+        items = json.loads(data)
+    except json.JSONDecodeError as e:
+        raise SystemExit(f"Input appears to be a JSON array but failed to parse it as JSON: {e}")
+    if not isinstance(items, list):
+        raise SystemExit("Top-level JSON must be a list when using array format.")
+    for item in items:
+        yield item
+
+
+# Canonical role for each accepted spelling; common capitalizations are listed so the
+# usual case is a single dict probe without building a lowercased copy.
+_ROLE_MAP: Dict[str, Role] = {
+    "system": "system",
+    "user": "user",
+    "assistant": "assistant",
+    "human": "user",
+    "System": "system",
+    "User": "user",
+    "Assistant": "assistant",
+    "Human": "user",
+}
+
+
+def normalize_role(value: Any) -> Optional[Role]:
+    if not isinstance(value, str):
+        return None
+    role = _ROLE_MAP.get(value)
+    if role is None:
+        role = _ROLE_MAP.get(value.strip().lower())
+    return role
 
 
 def normalize_messages(obj: Record) -> Optional[List[Message]]:
+    messages: List[Message] = []
+    append = messages.append
+
     # Case 1: Already in OpenAI messages format
-    if isinstance(obj.get("messages"), list):
-        messages: List[Message] = []
-        for m in obj["messages"]:
+    msgs = obj.get("messages")
+    if isinstance(msgs, list):
+        for m in msgs:
             if not isinstance(m, dict):
                 continue
-            role = normalize_role(m.get("role", ""))
             content = m.get("content")
-            if role and isinstance(content, str):
-                messages.append({"role": role, "content": content})
+            if not isinstance(content, str):
+                continue
+            role = normalize_role(m.get("role", ""))
+            if role:
+                append({"role": role, "content": content})
         return messages if messages else None
 
     # Case 2: conversations with {from|role, value|content}
     conv = obj.get("conversations") or obj.get("conversation")
     if isinstance(conv, list):
-        messages: List[Message] = []
         for m in conv:
             if not isinstance(m, dict):
                 continue
+            content = m.get("content")
+            if not isinstance(content, str):
+                content = m.get("value")
+                if not isinstance(content, str):
+                    continue
             role = normalize_role(m.get("role") or m.get("from") or "")
-            content = m.get("content") if isinstance(m.get("content"), str) else m.get("value")
-            if role and isinstance(content, str):
-                messages.append({"role": role, "content": content})
+            if role:
+                append({"role": role, "content": content})
         return messages if messages else None
 
     # Case 3: Top-level keys system/user/assistant as strings
-    keys = [k for k in ("system", "user", "assistant") if isinstance(obj.get(k), str)]
-    if keys:
-        messages: List[Message] = []
-        if isinstance(obj.get("system"), str):
-            messages.append({"role": "system", "content": obj["system"]})
-        if isinstance(obj.get("user"), str):
-            messages.append({"role": "user", "content": obj["user"]})
-        if isinstance(obj.get("assistant"), str):
-            messages.append({"role": "assistant", "content": obj["assistant"]})
-        return messages if messages else None
+    for role in ("system", "user", "assistant"):
+        content = obj.get(role)
+        if isinstance(content, str):
+            append({"role": role, "content": content})
+    return messages if messages else None
+
+
+def make_converter(
+    default_rejected: str,
+    map_user_field: Optional[str] = None,
+    map_chosen_field: Optional[str] = None,
+    map_reject_field: Optional[str] = None,
+    system_text: Optional[str] = None,
+) -> Converter:
+    # CLI options are fixed for the whole run, so pick the conversion path once
+    # instead of re-dispatching on them for every record.
+    if not (map_user_field or map_chosen_field or map_reject_field):
+
+        def convert_normalized(obj: Record) -> Optional[Record]:
+            # Fallback: try to normalize generic formats
+            messages = normalize_messages(obj)
+            if not messages:
+                return None
+            rejected = obj.get("rejected_response")
+            if not isinstance(rejected, str):
+                rejected = default_rejected
+            return {"messages": messages, "rejected_response": rejected}
+
+        return convert_normalized
+
+    if not (map_user_field and map_chosen_field):
+        # If mapping specified but required fields can never be present, skip every record
+        def convert_nothing(obj: Record) -> Optional[Record]:
+            return None
+
+        return convert_nothing
 
-    return None
+    st = system_text if isinstance(system_text, str) and system_text != "" else None
+    # Identical for every record, so one dict is shared by all outputs (they are only serialized)
+    system_message: Optional[Message] = {"role": "system", "content": st} if st else None
+
+    def convert_mapped(obj: Record) -> Optional[Record]:
+        # Fast reject for records from other formats that lack the mapped keys entirely
+        if map_user_field not in obj or map_chosen_field not in obj:
+            return None
+        user_text = obj[map_user_field]
+        chosen_text = obj[map_chosen_field]
+        if not (isinstance(user_text, str) and isinstance(chosen_text, str)):
+            # If mapping specified but required fields missing, skip this record
+            return None
+
+        if system_message is not None:
+            messages = [
+                system_message,
+                {"role": "user", "content": user_text},
+                {"role": "assistant", "content": chosen_text},
+            ]
+        else:
+            messages = [{"role": "user", "content": user_text}, {"role": "assistant", "content": chosen_text}]
+
+        reject_text = obj.get(map_reject_field) if map_reject_field else None
+        rejected = reject_text if isinstance(reject_text, str) else default_rejected
+        return {"messages": messages, "rejected_response": rejected}
+
+    return convert_mapped
 
 
 def convert_record(
@@ -72,66 +280,214 @@ def convert_record(
     map_reject_field: Optional[str] = None,
     system_text: Optional[str] = None,
 ) -> Optional[Record]:
-    # If explicit mapping is provided and fields exist, use it
-    if map_user_field or map_chosen_field or map_reject_field:
-        user_text = obj.get(map_user_field) if map_user_field else None
-        chosen_text = obj.get(map_chosen_field) if map_chosen_field else None
-        reject_text = obj.get(map_reject_field) if map_reject_field else None
+    # One-off conversion; bulk callers should build a converter once via make_converter()
+    convert = make_converter(default_rejected, map_user_field, map_chosen_field, map_reject_field, system_text)
+    return convert(obj)
 
-        if isinstance(user_text, str) and isinstance(chosen_text, str):
-            messages: List[Message] = []
-            st = system_text if isinstance(system_text, str) and system_text != "" else None
-            if st:
-                messages.append({"role": "system", "content": st})
-            messages.append({"role": "user", "content": user_text})
-            messages.append({"role": "assistant", "content": chosen_text})
 
-            rejected = reject_text if isinstance(reject_text, str) else default_rejected
-            return {"messages": messages, "rejected_response": rejected}
-        # If mapping specified but required fields missing, skip this record
+# Keys that make a record usable by normalize_messages()
+_GENERIC_KEYS = ("messages", "conversations", "conversation", "system", "user", "assistant")
+
+
+class LineFilter:
+    """Regex prefilter over raw JSONL lines that counts the lines it rejects."""
+
+    def __init__(self, keys: Iterable[bytes]) -> None:
+        # Any key character may be written as \uXXXX, which the quoted keys would miss,
+        # so lines containing such an escape always pass.
+        pattern = rb'\\u|"(?:' + b"|".join(re.escape(k) for k in keys) + rb')"'
+        self._search = re.compile(pattern).search
+        self.skipped = 0
+
+    def __call__(self, line: bytes) -> bool:
+        if self._search(line) is not None:
+            return True
+        self.skipped += 1
+        return False
+
+
+def _plain_key(key: str) -> Optional[bytes]:
+    # Key bytes as they appear in raw JSON when written without escapes, or None if the key
+    # needs (or commonly gets) a short escape such as \" or \/
+    if not key.isascii() or not key.isprintable() or any(c in key for c in '"\\/'):
         return None
+    return key.encode("ascii")
+
+
+def make_line_filter(
+    map_user_field: Optional[str] = None,
+    map_chosen_field: Optional[str] = None,
+    map_reject_field: Optional[str] = None,
+) -> Optional[LineFilter]:
+    # Opt-in (--prefilter) scan run on raw JSONL lines before parsing: lines that contain none of
+    # the keys the converter needs are dropped without a JSON parse. This only pays off on mixed
+    # corpora where many lines are skipped; on homogeneous input it is pure overhead.
+    if not (map_user_field or map_chosen_field or map_reject_field):
+        return LineFilter(k.encode("ascii") for k in _GENERIC_KEYS)
 
-    # Fallback: try to normalize generic formats
-    messages = normalize_messages(obj)
-    if not messages:
+    if not (map_user_field and map_chosen_field):
         return None
-    rejected = obj.get("rejected_response")
-    if not isinstance(rejected, str):
-        rejected = default_rejected
-    return {"messages": messages, "rejected_response": rejected}
+    user_key = _plain_key(map_user_field)
+    chosen_key = _plain_key(map_chosen_field)
+    if user_key is None or chosen_key is None:
+        return None
+    return LineFilter((user_key, chosen_key))
 
 
-def iter_json_items_from_stream(stream: io.TextIOBase) -> Any:
-    # Try to read as JSON Lines first
-    for ln in stream:
+def iter_json_items_from_stream(
+    stream: BinaryIO,
+    line_filter: Optional[LineFilter] = None,
+    stream_array: bool = False,
+) -> Iterator[Any]:
+    prefix, is_array = sniff_json_array(stream)
+    source = PrefixedStream(prefix, stream)
+    if is_array:
+        yield from iter_json_array_items(source, stream_array)
+        return
+
+    # Read as JSON Lines; lines stay as bytes and are decoded by the JSON parser
+    for ln in source:
         line = ln.strip()
         if not line:
             continue
-        # Heuristically detect JSON array file if first non-empty line starts with [
-        if line.startswith("["):
-            # Read the whole file content (already read first line)
-            rest = [line] + [l for l in stream]
-            text = "".join(rest)
-            try:
-                data = json.loads(text)
-            except json.JSONDecodeError:
-                raise SystemExit("Input appears to be a JSON array but failed to parse it as JSON.")
-            if isinstance(data, list):
-                for item in data:
-                    yield item
-                return
-            else:
-                raise SystemExit("Top-level JSON must be a list when using array format.")
+        # A later line starting with [ switches to array mode for the rest of the input
+        if line.startswith(b"["):
+            yield from iter_json_array_items(PrefixedStream(ln, source), stream_array)
+            return
         else:
             # Treat as JSONL: current line is a JSON object
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError as e:
-                raise SystemExit(f"Failed to parse JSONL line: {e}\nLine: {line[:200]}")
-            yield obj
+            if line_filter is not None and not line_filter(line):
+                continue
+            yield parse_jsonl_line(line)
     return
 
 
+def parse_jsonl_line(line: bytes) -> Any:
+    try:
+        return loads(line)
+    except json.JSONDecodeError as e:
+        error = e
+    if loads is not json.loads:
+        # orjson is strict RFC 8259; the stdlib also accepts NaN/Infinity written by json.dumps
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError as e:
+            error = e
+    raise SystemExit(f"Failed to parse JSONL line: {error}\nLine: {line[:200].decode('utf-8', 'replace')}")
+
+
+def convert_items(items: Iterable[Any], out_stream: BinaryIO, convert: Converter) -> Tuple[int, int]:
+    use_orjson = orjson is not None
+    num_in = 0
+    num_out = 0
+    buf = bytearray()
+    try:
+        for item in items:
+            num_in += 1
+            converted = convert(item)
+            if not converted:
+                continue
+            if use_orjson:
+                buf += orjson.dumps(converted, option=orjson.OPT_APPEND_NEWLINE)
+            else:
+                buf += json_dumps_line(converted)
+            num_out += 1
+            if len(buf) >= WRITE_BUFFER_SIZE:
+                out_stream.write(buf)
+                buf.clear()
+    finally:
+        if buf:
+            out_stream.write(buf)
+    return num_in, num_out
+
+
+# Per-process converter and line filter, built once by the pool initializer instead of pickled per batch
+_worker_convert: Optional[Converter] = None
+_worker_filter: Optional[LineFilter] = None
+
+
+def _init_worker(converter_args: Tuple[Any, ...], prefilter: bool) -> None:
+    global _worker_convert, _worker_filter
+    _worker_convert = make_converter(*converter_args)
+    _worker_filter = make_line_filter(*converter_args[1:4]) if prefilter else None
+
+
+def _convert_lines(lines: List[bytes]) -> Tuple[int, int, int, bytes, Optional[str]]:
+    # Runs in a worker: parse, convert and serialize a batch of JSONL lines into one blob.
+    # Parse errors are returned rather than raised so the parent can flush earlier output first.
+    convert = _worker_convert
+    assert convert is not None, "worker used without _init_worker"
+    line_filter = _worker_filter
+    use_orjson = orjson is not None
+    num_in = 0
+    num_out = 0
+    num_skipped = 0
+    buf = bytearray()
+    for ln in lines:
+        line = ln.strip()
+        if not line:
+            continue
+        if line_filter is not None and not line_filter(line):
+            num_skipped += 1
+            continue
+        try:
+            obj = parse_jsonl_line(line)
+        except SystemExit as e:
+            return num_in, num_out, num_skipped, bytes(buf), str(e)
+        num_in += 1
+        converted = convert(obj)
+        if not converted:
+            continue
+        if use_orjson:
+            buf += orjson.dumps(converted, option=orjson.OPT_APPEND_NEWLINE)
+        else:
+            buf += json_dumps_line(converted)
+        num_out += 1
+    return num_in, num_out, num_skipped, bytes(buf), None
+
+
+def iter_line_batches(stream: Iterable[bytes], batch_size: int) -> Iterator[List[bytes]]:
+    batch: List[bytes] = []
+    for ln in stream:
+        batch.append(ln)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def convert_stream_parallel(
+    in_stream: BinaryIO,
+    out_stream: BinaryIO,
+    converter_args: Tuple[Any, ...],
+    workers: int,
+    stream_array: bool = False,
+    prefilter: bool = False,
+) -> Tuple[int, int, int]:
+    # JSON arrays cannot be split by line and stay sequential
+    prefix, is_array = sniff_json_array(in_stream)
+    stream = PrefixedStream(prefix, in_stream)
+    if is_array:
+        items = iter_json_array_items(stream, stream_array)
+        return convert_items(items, out_stream, make_converter(*converter_args)) + (0,)
+
+    num_in = 0
+    num_out = 0
+    num_skipped = 0
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(converter_args, prefilter)) as pool:
+        # imap keeps output in input order; the pool's feeder thread reads ahead while workers convert
+        for n_in, n_out, n_skipped, blob, error in pool.imap(_convert_lines, iter_line_batches(stream, PARALLEL_BATCH_LINES)):
+            num_in += n_in
+            num_out += n_out
+            num_skipped += n_skipped
+            if blob:
+                out_stream.write(blob)
+            if error is not None:
+                raise SystemExit(error)
+    return num_in, num_out, num_skipped
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Convert conversation JSON/JSONL formats to {messages, rejected_response} JSONL.")
     parser.add_argument("--input", "-i", required=False, default="-", help="Input file path (.jsonl or .json array). Use '-' for STDIN.")
@@ -143,57 +499,57 @@ def main() -> None:
     parser.add_argument("--chosen-field", required=False, default=None, help="Field name for the chosen assistant reply (e.g., 'answer_zh').")
     parser.add_argument("--reject-field", required=False, default=None, help="Field name for the rejected response (e.g., 'answer_en').")
     parser.add_argument("--system-text", required=False, default=None, help="Optional system prompt to include as first message.")
+    parser.add_argument("--stream-array", action="store_true", help="Parse JSON-array input incrementally with ijson to bound memory. Rejects integers outside int64, overflowing floats and NaN/Infinity.")
+    parser.add_argument("--prefilter", action="store_true", help="Skip JSONL lines that contain none of the expected keys without parsing them. Speeds up mixed corpora; malformed lines without those keys are skipped instead of aborting.")
+    parser.add_argument("--workers", "-j", type=int, required=False, default=1, help="Worker processes for JSONL input (0 = all CPUs, 1 = no multiprocessing).")
 
     args = parser.parse_args()
-
-    # Ensure UTF-8 IO
-    try:
-        sys.stdin.reconfigure(encoding="utf-8")  # type: ignore[attr-defined]
-        sys.stdout.reconfigure(encoding="utf-8")  # type: ignore[attr-defined]
-    except Exception:
-        pass
+    if args.stream_array and ijson is None:
+        parser.error("--stream-array requires the 'ijson' package")
+    if args.workers < 0:
+        parser.error("--workers must be >= 0")
 
     # Input stream
     if args.input == "-":
-        in_stream = sys.stdin
+        in_stream = sys.stdin.buffer
         close_in = False
     else:
-        in_stream = open(args.input, "r", encoding="utf-8")
+        in_stream = open(args.input, "rb")
         close_in = True
 
     # Output stream
     if args.output == "-":
-        out_stream = sys.stdout
+        out_stream = sys.stdout.buffer
         close_out = False
     else:
         # Create parent dir if needed
         os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
-        out_stream = open(args.output, "w", encoding="utf-8")
+        out_stream = open(args.output, "wb", buffering=WRITE_BUFFER_SIZE)
         close_out = True
 
-    num_in = 0
-    num_out = 0
+    converter_args = (args.default_rejected, args.user_field, args.chosen_field, args.reject_field, args.system_text)
+    workers = args.workers or os.cpu_count() or 1
+
     try:
-        for item in iter_json_items_from_stream(in_stream):
-            num_in += 1
-            converted = convert_record(
-                item,
-                args.default_rejected,
-                map_user_field=args.user_field,
-                map_chosen_field=args.chosen_field,
-                map_reject_field=args.reject_field,
-                system_text=args.system_text if args.system_text is not None else None,
+        if workers > 1:
+            num_in, num_out, num_skipped = convert_stream_parallel(
+                in_stream, out_stream, converter_args, workers, args.stream_array, args.prefilter
             )
-            if not converted:
-                continue
-            out_stream.write(json.dumps(converted, ensure_ascii=False, separators=(",", ":")) + "\n")
-            num_out += 1
+        else:
+            convert = make_converter(*converter_args)
+            line_filter = make_line_filter(args.user_field, args.chosen_field, args.reject_field) if args.prefilter else None
+            items = iter_json_items_from_stream(in_stream, line_filter, args.stream_array)
+            num_in, num_out = convert_items(items, out_stream, convert)
+            num_skipped = line_filter.skipped if line_filter is not None else 0
     finally:
+        out_stream.flush()
         if close_in:
             in_stream.close()
         if close_out:
             out_stream.close()
 
+    if num_skipped:
+        print(f"Skipped {num_skipped} JSONL lines without any expected key (--prefilter).", file=sys.stderr)
     if num_out == 0:
         # Provide a helpful message to STDERR but keep STDOUT clean
         print("No valid conversation records found to convert.", file=sys.stderr)
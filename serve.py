@@ -1,21 +1,128 @@
 #!/usr/bin/env python3
+import hashlib
 import os
-from http.server import SimpleHTTPRequestHandler, HTTPServer
+import stat
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote
 
 # Serve files from this script's directory
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
+# Files up to this size are kept in memory
+CACHE_MAX_FILE_SIZE = 1 << 20
+
+# URL path -> (body, headers, mtime, size). Filled at startup and revalidated with one
+# os.stat per hit, so edited files are re-read once and deleted files drop out.
+CACHE: Dict[str, Tuple[bytes, Dict[str, str], float, int]] = {}
+
+
+def load_entry(path: str) -> Optional[Tuple[bytes, Dict[str, str], float, int]]:
+	try:
+		# Check before opening: open() on a FIFO would block
+		if not stat.S_ISREG(os.stat(path).st_mode):
+			return None
+		with open(path, "rb") as f:
+			st = os.fstat(f.fileno())
+			if not stat.S_ISREG(st.st_mode) or st.st_size > CACHE_MAX_FILE_SIZE:
+				return None
+			body = f.read()
+	except OSError:
+		# Broken symlinks, unreadable files, files removed mid-walk: leave them to the stock handler
+		return None
+	return body, {
+		"Content-Length": str(len(body)),
+		"ETag": '"%s"' % hashlib.sha1(body).hexdigest(),
+		"Last-Modified": formatdate(st.st_mtime, usegmt=True),
+	}, st.st_mtime, st.st_size
+
+
+def build_cache() -> None:
+	for dirpath, dirnames, filenames in os.walk("."):
+		# Skip hidden directories such as .git
+		dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+		for name in filenames:
+			path = os.path.join(dirpath, name)
+			entry = load_entry(path)
+			if entry is not None:
+				CACHE["/" + os.path.relpath(path).replace(os.sep, "/")] = entry
+
+
 class RootHandler(SimpleHTTPRequestHandler):
 	def do_GET(self):
 		if self.path in ("/", "/index.html"):
 			self.path = "/课件.html"
-		return super().do_GET()
+		if not self.send_cached(head_only=False):
+			return super().do_GET()
+
+	def do_HEAD(self):
+		if self.path in ("/", "/index.html"):
+			self.path = "/课件.html"
+		if not self.send_cached(head_only=True):
+			return super().do_HEAD()
+
+	def send_cached(self, head_only: bool) -> bool:
+		url_path = unquote(self.path.split("?", 1)[0].split("#", 1)[0])
+		entry = CACHE.get(url_path)
+		if entry is None:
+			return False
+		path = url_path[1:]
+		try:
+			st = os.stat(path)
+		except OSError:
+			st = None
+		if st is None or st.st_mtime != entry[2] or st.st_size != entry[3]:
+			# Changed or deleted since it was cached: reload once, or hand over to the stock handler
+			entry = load_entry(path) if st is not None else None
+			if entry is None:
+				CACHE.pop(url_path, None)
+				return False
+			CACHE[url_path] = entry
+		body, headers, mtime, _ = entry
+		etag = headers["ETag"]
+		if self.not_modified(etag, mtime):
+			self.send_response(304)
+			self.send_header("ETag", etag)
+			self.end_headers()
+			return True
+		self.send_response(200)
+		# guess_type honours extensions_map (e.g. .gz/.bz2/.xz), unlike plain mimetypes
+		self.send_header("Content-Type", self.guess_type(path))
+		for key, value in headers.items():
+			self.send_header(key, value)
+		self.end_headers()
+		if not head_only:
+			self.wfile.write(body)
+		return True
+
+	def not_modified(self, etag: str, mtime: float) -> bool:
+		if_none_match = self.headers.get("If-None-Match")
+		if if_none_match:
+			return if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))
+		# Same If-Modified-Since handling as SimpleHTTPRequestHandler.send_head
+		if_modified_since = self.headers.get("If-Modified-Since")
+		if not if_modified_since:
+			return False
+		try:
+			ims = parsedate_to_datetime(if_modified_since)
+		except (TypeError, IndexError, OverflowError, ValueError):
+			return False
+		if ims.tzinfo is None:
+			ims = ims.replace(tzinfo=timezone.utc)
+		if ims.tzinfo is not timezone.utc:
+			return False
+		last_modified = datetime.fromtimestamp(mtime, timezone.utc).replace(microsecond=0)
+		return last_modified <= ims
 
 def main() -> None:
+	build_cache()
 	server_address = ("0.0.0.0", 8000)
-	httpd = HTTPServer(server_address, RootHandler)
+	# One thread per connection so a slow client does not block everyone else
+	httpd = ThreadingHTTPServer(server_address, RootHandler)
 	print("Serving 课件.html on http://0.0.0.0:8000/")
 	httpd.serve_forever()
 
 if __name__ == "__main__":
-	main() 
\ No newline at end of file
+	main()